@@ -8,96 +8,301 @@ __date__ = "2022/12/07"
 
 import os
 import re
-import glob
-import json
+import pathlib
 import time
 import datetime
+import functools
 import warnings
-import configparser
+import collections
+import concurrent.futures
 
-from typing import List
+from typing import List, Optional
+
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+
+# Sub-directories of root_dir, each exposed as a `<name>_path` attribute.
+# "grids" is not used for now.
+_SUBDIRS = (
+    "calib",
+    "config",
+    "dvad",
+    "diagnostics",
+    "flow",
+    "log",
+    "nowcast",
+    "realtime",
+    "vols",
+    "vvad",
+    "winds",
+)
+
+# (attribute, postmaster.conf section, key, default port)
+_PORTS = (
+    ("port_manager", "manager", "service", 9900),
+    ("port_flow_dispatcher", "flow", "dispatcher", 9920),
+    ("port_flow_service", "flow", "service", 9921),
+    ("port_winds_service", "winds", "service", 9931),
+    ("port_diagnostics_service", "diagnostics", "service", 9941),
+    ("port_nowcast_service", "nowcast", "service", 9951),
+    ("port_success_service", "success", "service", 9961),
+)
+
+_TS_RE = re.compile(r"[0-9]{8}_[0-9]{6}")
+
+
+@functools.lru_cache(maxsize=4096)
+def _ts_to_dt(timestamp: str) -> datetime.datetime:
+    return datetime.datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+
+
+def _parse_ts(name: str) -> datetime.datetime:
+    """
+    Extract the last YYYYmmdd_HHMMSS timestamp found in a file name.
+    """
+    return _ts_to_dt(_TS_RE.findall(name)[-1])
+
+
+def _read_ini(fname: str) -> dict:
+    """
+    Minimal INI reader for the fixed postmaster.conf schema. Returns a
+    {section: {key: value}} dictionary, same as configparser for plain
+    `key = value` files. Anything else (continuation lines, duplicate
+    sections or keys, malformed lines) raises a ValueError so that the
+    caller can fall back to configparser.
+    """
+    config = {}
+    section = None
+    for line in pathlib.Path(fname).read_text().splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith(("#", ";")):
+            continue
+        if line[0].isspace():
+            raise ValueError(f"Continuation line in configuration file {fname}: {line}")
+        if stripped.startswith("["):
+            if not stripped.endswith("]") or stripped[1:-1] in config:
+                raise ValueError(f"Invalid section in configuration file {fname}: {line}")
+            section = config[stripped[1:-1]] = {}
+            continue
+        idx = min((i for i in (stripped.find("="), stripped.find(":")) if i >= 0), default=-1)
+        if section is None or idx < 0:
+            raise ValueError(f"Invalid line in configuration file {fname}: {line}")
+        key = stripped[:idx].strip().lower()
+        if key in section:
+            raise ValueError(f"Duplicate key in configuration file {fname}: {line}")
+        section[key] = stripped[idx + 1 :].strip()
+    return config
+
+
+def _read_ports(config) -> dict:
+    """
+    Extract the service ports from a parsed postmaster.conf (either the
+    _read_ini dictionary or a ConfigParser).
+    """
+    return {attr: int(config[section][key]) for attr, section, key, _ in _PORTS}
 
 
 class Swirl:
+    # Directories that must exist when do_checks is set (cmss paths are exempt).
+    _PATH_ATTRS = tuple(f"{name}_path" for name in _SUBDIRS) + ("config_3dwinds_path",)
+
+    __slots__ = _PATH_ATTRS + (
+        "cmss_egress_path",
+        "cmss_ingress_path",
+        "regions",
+        "rid_regions",
+        "port_manager",
+        "port_flow_service",
+        "port_flow_dispatcher",
+        "port_nowcast_service",
+        "port_winds_service",
+        "port_diagnostics_service",
+        "port_success_service",
+        "_radar_site_info",
+        "html_dir",
+    )
+
+    # Instances returned by Swirl.get, keyed by constructor arguments.
+    _instances = {}
+
     def __init__(
         self, root_dir="/srv/data/swirl", etc_dir="/etc/opt/swirl/", cmss_dir="/srv/data/cmss-client", do_checks=True
     ) -> None:
-        self.calib_path = os.path.join(root_dir, "calib")
+        for name in _SUBDIRS:
+            setattr(self, f"{name}_path", os.path.join(root_dir, name))
+        self.config_3dwinds_path = os.path.join(self.config_path, "3dwinds")
         self.cmss_egress_path = os.path.join(cmss_dir, "swirl-egress")
         self.cmss_ingress_path = os.path.join(cmss_dir, "swirl-ingress")
-        self.config_path = os.path.join(root_dir, "config")
-        self.config_3dwinds_path = os.path.join(root_dir, "config", "3dwinds")
-        self.dvad_path = os.path.join(root_dir, "dvad")
-        self.diagnostics_path = os.path.join(root_dir, "diagnostics")        
-        self.flow_path = os.path.join(root_dir, "flow")
-        # self.grids_path = os.path.join(root_dir, "grids")
-        self.log_path = os.path.join(root_dir, "log")
-        self.nowcast_path = os.path.join(root_dir, "nowcast")
-        self.realtime_path = os.path.join(root_dir, "realtime")
-        self.vols_path = os.path.join(root_dir, "vols")
-        self.vvad_path = os.path.join(root_dir, "vvad")
-        self.winds_path = os.path.join(root_dir, "winds")
         if do_checks:
             self.check_paths_exist()
         self.set_regions(etc_dir)
         self.set_ports(etc_dir)
-        self.set_radar_site_info()
+        # Radar site list is parsed on first access of `radar_site_info`.
+        self._radar_site_info = None
         # Web pages:
         self.html_dir = "/srv/web/swirl/www/html"
 
+    @classmethod
+    def get(
+        cls, root_dir="/srv/data/swirl", etc_dir="/etc/opt/swirl/", cmss_dir="/srv/data/cmss-client", do_checks=True
+    ) -> "Swirl":
+        """
+        Return a cached Swirl instance for these arguments. A new instance is
+        built if any of the configuration files changed since the last call.
+        With do_checks, the directories are checked again on every call.
+
+        Parameters:
+        ===========
+        root_dir: str
+        etc_dir: str
+        cmss_dir: str
+        do_checks: bool
+
+        Returns:
+        ========
+        swirl: Swirl
+        """
+        root_dir, etc_dir, cmss_dir = (os.path.normpath(d) for d in (root_dir, etc_dir, cmss_dir))
+        key = (root_dir, etc_dir, cmss_dir, do_checks)
+        mtimes = cls._get_config_mtimes(root_dir, etc_dir)
+        try:
+            instance, cached_mtimes = cls._instances[key]
+            if cached_mtimes == mtimes:
+                if do_checks:
+                    instance.check_paths_exist()
+                return instance
+        except KeyError:
+            pass
+
+        instance = cls(root_dir=root_dir, etc_dir=etc_dir, cmss_dir=cmss_dir, do_checks=do_checks)
+        cls._instances[key] = (instance, mtimes)
+        return instance
+
+    @staticmethod
+    def _get_config_mtimes(root_dir, etc_dir):
+        fnames = [
+            os.path.join(etc_dir, "regions.json"),
+            os.path.join(etc_dir, "postmaster.conf"),
+            os.path.join(root_dir, "config", "radar_site_list.csv"),
+        ]
+        mtimes = []
+        for fname in fnames:
+            try:
+                mtimes.append(os.stat(fname).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
     def check_paths_exist(self):
-        for k, v in self.__dict__.items():
-            if "path" in k:
-                if "cmss" in k:
-                    continue
-                if not os.path.exists(v):
-                    raise FileNotFoundError(f"Directory {v} not found.")    
+        # Group the directories by parent so that each parent is listed once
+        # with scandir instead of stat'ing every directory.
+        by_parent = collections.defaultdict(list)
+        for k in self._PATH_ATTRS:
+            v = getattr(self, k)
+            by_parent[os.path.dirname(os.path.normpath(v)) or os.curdir].append(v)
+
+        missing = []
+        for parent, paths in by_parent.items():
+            try:
+                with os.scandir(parent) as it:
+                    present = {e.name for e in it if e.is_dir()}
+            except PermissionError:
+                # Listing needs read permission, stat'ing the children only search permission.
+                missing.extend(v for v in paths if not os.path.isdir(v))
+                continue
+            except OSError:
+                # Missing or not a directory: all its children are missing.
+                present = set()
+            missing.extend(v for v in paths if os.path.basename(os.path.normpath(v)) not in present)
+
+        if len(missing) == 1:
+            raise FileNotFoundError(f"Directory {missing[0]} not found.")
+        elif missing:
+            raise FileNotFoundError(f"Directories not found: {', '.join(missing)}.")
 
     def set_regions(self, etc_dir):
         fname = os.path.join(etc_dir, "regions.json")
-        with open(fname) as fid:
-            self.regions = json.load(fid)
+        self.regions = _json.loads(pathlib.Path(fname).read_bytes())
         if len(self.regions) == 0:
             raise ValueError("Problem with the wind region configuration file.")
 
-        self.rid_regions = {}
-        for k, v in self.regions.items():
-            for n in v:
-                if n in self.rid_regions.keys():
-                    warnings.warn(
-                        f"Key {n} is present in 2 different regions. "
-                        "It does not support radars overlapping region for now."
-                    )
-                self.rid_regions[n] = k
+        pairs = [(n, k) for k, v in self.regions.items() for n in v]
+        self.rid_regions = dict(pairs)
+        if len(self.rid_regions) != len(pairs):
+            duplicates = [n for n, count in collections.Counter(n for n, _ in pairs).items() if count > 1]
+            warnings.warn(
+                f"Radars {duplicates} appear in more than one region entry. "
+                "It does not support radars overlapping region for now, the last entry is used."
+            )
 
     def set_ports(self, etc_dir):
+        fname = os.path.join(etc_dir, "postmaster.conf")
         try:
-            fname = os.path.join(etc_dir, "postmaster.conf")
-            config = configparser.ConfigParser()
-            config.read(fname)
-            self.port_manager = config.getint("manager", "service")
-            self.port_flow_service = config.getint("flow", "service")
-            self.port_flow_dispatcher = config.getint("flow", "dispatcher")
-            self.port_nowcast_service = config.getint("nowcast", "service")
-            self.port_winds_service = config.getint("winds", "service")
-            self.port_diagnostics_service = config.getint("diagnostics", "service")
-            self.port_success_service = config.getint("success", "service")
+            ports = _read_ports(_read_ini(fname))
         except Exception:
-            self.port_manager = 9900
-            self.port_flow_dispatcher = 9920
-            self.port_flow_service = 9921
-            self.port_winds_service = 9931
-            self.port_diagnostics_service = 9941
-            self.port_nowcast_service = 9951
-            self.port_success_service = 9961
+            # Syntax the minimal reader does not handle (continuation lines,
+            # interpolation, [DEFAULT] keys...) goes through configparser.
+            try:
+                import configparser
+
+                config = configparser.ConfigParser()
+                config.read(fname)
+                ports = _read_ports(config)
+            except Exception:
+                warnings.warn(f"Could not read the service ports from {fname}. Using default ports.")
+                ports = {attr: default for attr, _, _, default in _PORTS}
+
+        for attr, port in ports.items():
+            setattr(self, attr, port)
+
+    @property
+    def radar_site_info(self):
+        """Radar site list, radar_site_list.csv is read on first access."""
+        if self._radar_site_info is None:
+            self.set_radar_site_info()
+        return self._radar_site_info
+
+    @radar_site_info.setter
+    def radar_site_info(self, value):
+        self._radar_site_info = value
 
     def set_radar_site_info(self):
         import pandas as pd
 
         radar_fname = os.path.join(self.config_path, "radar_site_list.csv")
-        self.radar_site_info = pd.read_csv(radar_fname)
-        if len(self.radar_site_info) == 0:
+        radar_site_info = pd.read_csv(radar_fname, engine="c", dtype={"site_lat": "float64", "site_lon": "float64"})
+        if len(radar_site_info) == 0:
             raise ValueError(f"Invalid radar configuration file: {radar_fname}. Exiting code.")
+        self._radar_site_info = radar_site_info
+        return None
+
+    def _check_rid(
+        self, rid: int, datestr: str, radar_dtime: datetime.datetime, max_radar_downtime: int
+    ) -> Optional[str]:
+        """
+        Return why the radar should be removed from its region, or None if
+        its latest volume is recent enough.
+        """
+        path = os.path.join(self.vols_path, str(rid), datestr)
+        # Only the newest file matters, no need to list and sort the whole directory.
+        try:
+            with os.scandir(path) as it:
+                latest = max((e.name for e in it if "." in e.name and not e.name.startswith(".")), default=None)
+        except (FileNotFoundError, NotADirectoryError):
+            return f"No data for radar {rid} existing today. Removing radar {rid} from region."
+        except OSError:
+            # Unreadable directory, glob used to silently return no files.
+            latest = None
+        if latest is None:
+            return f"No file found for radar {rid}. Removing radar {rid} from region."
+
+        rtime = _parse_ts(latest)
+        delta = radar_dtime - rtime
+        if delta.total_seconds() > max_radar_downtime:
+            return f"No data for radar {rid} for {delta}. Removing radar {rid} from region."
+
         return None
 
     def update_rids_in_region(
@@ -116,28 +321,21 @@ class Swirl:
         ========
         valid_rids: List[int, ...]
         """
-        get_time = lambda x: datetime.datetime.strptime(re.findall("[0-9]{8}_[0-9]{6}", x)[-1], "%Y%m%d_%H%M%S")
-
         regions_rids = self.regions[region_name]
         datestr = radar_dtime.strftime("%Y%m%d")
+        # Each check is a few filesystem calls, run them concurrently. Reasons
+        # are printed here, in region order, rather than from the workers.
+        # The pool only lives for this call so that no thread survives into a fork().
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(32, len(regions_rids)) or 1) as executor:
+            reasons = list(
+                executor.map(lambda r: self._check_rid(r, datestr, radar_dtime, max_radar_downtime), regions_rids)
+            )
         valid_rids = []
-        for r in regions_rids:
-            path = os.path.join(self.vols_path, str(r), datestr)
-            if not os.path.exists(path):
-                print(f"No data for radar {r} existing today. Removing radar {r} from region.")
-                continue
-
-            flist = sorted(glob.glob(os.path.join(path, "*.*")))
-            if len(flist) == 0:
-                print(f"No file found for radar {r}. Removing radar {r} from region.")
-                continue
-
-            rtime = get_time(flist[-1])
-            delta = radar_dtime - rtime
-            if delta.total_seconds() > max_radar_downtime:
-                print(f"No data for radar {r} for {delta}. Removing radar {r} from region.")
-            else:
+        for r, reason in zip(regions_rids, reasons):
+            if reason is None:
                 valid_rids.append(r)
+            else:
+                print(reason)
 
         if len(valid_rids) == 0:
             raise ValueError(f"No radar currently available for region {region_name}.")
@@ -150,14 +348,19 @@ class Chronos:
     https://www.youtube.com/watch?v=QcHvzNBtlOw
     """
 
-    def __init__(self, messg=None):
+    __slots__ = ("messg", "silent", "start", "time")
+
+    def __init__(self, messg=None, silent=False):
         self.messg = messg
+        self.silent = silent
 
     def __enter__(self):
-        self.start = time.time()
+        self.start = time.perf_counter_ns()
 
     def __exit__(self, ntype, value, traceback):
-        self.time = time.time() - self.start
+        self.time = (time.perf_counter_ns() - self.start) / 1e9
+        if self.silent:
+            return None
         if self.messg is not None:
             print(f"{self.messg} took {self.time:.2f}s.")
         else:
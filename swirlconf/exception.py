@@ -1,7 +1,9 @@
 import asyncio
-import traceback
+import logging
 from functools import wraps
 
+logger = logging.getLogger(__name__)
+
 
 def buffer(func):
     """
@@ -13,13 +15,12 @@ def buffer(func):
         async def wrapper(*args, **kwargs):
             try:
                 rslt = await func(*args, **kwargs)
-            except FileExistsError:
-                return None
-            except FileNotFoundError:
-                print(f"Could not find all files.")
+            except (FileExistsError, FileNotFoundError) as err:
+                if isinstance(err, FileNotFoundError):
+                    print(f"Could not find all files.")
                 return None
             except Exception:
-                traceback.print_exc()
+                logger.exception("Error caught by buffer in %s.", func.__name__)
                 return None
             return rslt
 
@@ -29,13 +30,12 @@ def buffer(func):
         def wrapper(*args, **kwargs):
             try:
                 rslt = func(*args, **kwargs)
-            except FileExistsError:
-                return None
-            except FileNotFoundError:
-                print(f"Could not find all files.")
+            except (FileExistsError, FileNotFoundError) as err:
+                if isinstance(err, FileNotFoundError):
+                    print(f"Could not find all files.")
                 return None
             except Exception:
-                traceback.print_exc()
+                logger.exception("Error caught by buffer in %s.", func.__name__)
                 return None
             return rslt
 
@@ -2,14 +2,14 @@ import pickle
 import asyncio
 import traceback
 
+_MESSAGE_KEYS = frozenset(["who", "what", "where", "when", "uid"])
+
 
 async def decode_message(message):
     data = pickle.loads(message)
-    for key in ["who", "what", "where", "when", "uid"]:
-        try:
-            _ = data[key]
-        except KeyError:
-            raise KeyError(f"Key: {key} not found in incoming message.")
+    missing = _MESSAGE_KEYS - data.keys()
+    if missing:
+        raise KeyError(f"Key: {', '.join(sorted(missing))} not found in incoming message.")
 
     return data
 
@@ -28,8 +28,10 @@ async def dispatch_message(message: str, port: int) -> None:
     try:
         _, writer = await asyncio.open_connection("127.0.0.1", port)
         writer.write(message)
+        await writer.drain()
         writer.close()
-    except ConnectionRefusedError:
+        await writer.wait_closed()
+    except ConnectionError:
         print(f"Could not send message to port {port}.")
         traceback.print_exc()
 
@@ -0,0 +1,292 @@
+import io
+import os
+import json
+import signal
+import datetime
+import tempfile
+import unittest
+import warnings
+import contextlib
+from unittest import mock
+import configparser
+
+from swirlconf import Swirl
+from swirlconf.core import _read_ini, _PORTS, _SUBDIRS
+
+
+POSTMASTER_CONF = """\
+# SWIRL postmaster configuration.
+[manager]
+service = 9900
+
+[flow]
+service = 9921
+Dispatcher: 9920
+; comment
+[nowcast]
+service=9951
+[winds]
+service = 9931
+[diagnostics]
+service = 9941
+[success]
+service = 9961
+"""
+
+
+def make_tree(base_dir, regions=None):
+    """
+    Create a minimal SWIRL root_dir and etc_dir under base_dir.
+    """
+    root_dir = os.path.join(base_dir, "root")
+    etc_dir = os.path.join(base_dir, "etc")
+    for name in _SUBDIRS:
+        os.makedirs(os.path.join(root_dir, name))
+    os.mkdir(os.path.join(root_dir, "config", "3dwinds"))
+    os.mkdir(etc_dir)
+    with open(os.path.join(root_dir, "config", "radar_site_list.csv"), "w") as fid:
+        fid.write("id,site_lat,site_lon\n2,-37.85,144.75\n")
+    with open(os.path.join(etc_dir, "regions.json"), "w") as fid:
+        json.dump(regions or {"vic": [2]}, fid)
+    with open(os.path.join(etc_dir, "postmaster.conf"), "w") as fid:
+        fid.write(POSTMASTER_CONF)
+    return root_dir, etc_dir
+
+
+class TestPostmasterConf(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.etc_dir = self.tmpdir.name
+        self.fname = os.path.join(self.etc_dir, "postmaster.conf")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_conf(self, text):
+        with open(self.fname, "w") as fid:
+            fid.write(text)
+
+    def get_ports(self):
+        swirl = Swirl.__new__(Swirl)
+        swirl.set_ports(self.etc_dir)
+        return {attr: getattr(swirl, attr) for attr, _, _, _ in _PORTS}
+
+    def get_configparser_ports(self):
+        config = configparser.ConfigParser()
+        config.read(self.fname)
+        return {attr: config.getint(section, key) for attr, section, key, _ in _PORTS}
+
+    def test_read_ini_matches_configparser(self):
+        self.write_conf(POSTMASTER_CONF)
+        config = configparser.ConfigParser()
+        config.read(self.fname)
+        expected = {section: dict(config[section]) for section in config.sections()}
+        self.assertEqual(_read_ini(self.fname), expected)
+
+    def test_set_ports_matches_configparser(self):
+        cases = {
+            "plain": POSTMASTER_CONF,
+            "continuation": POSTMASTER_CONF + "[extra]\nhosts = a\n    b\n",
+            "interpolation": POSTMASTER_CONF.replace("service = 9900", "base = 99\nservice = %(base)s00"),
+            "default": "[DEFAULT]\nservice = 9900\n" + POSTMASTER_CONF.replace("service = 9900\n", ""),
+        }
+        for name, text in cases.items():
+            with self.subTest(name):
+                self.write_conf(text)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("error")
+                    self.assertEqual(self.get_ports(), self.get_configparser_ports())
+
+    def test_set_ports_warns_on_fallback(self):
+        self.write_conf("[manager]\nservice = not-a-port\n")
+        with self.assertWarns(UserWarning):
+            ports = self.get_ports()
+        self.assertEqual(ports, {attr: default for attr, _, _, default in _PORTS})
+
+
+class TestCheckPathsExist(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root_dir = self.tmpdir.name
+        for name in _SUBDIRS:
+            os.mkdir(os.path.join(self.root_dir, name))
+        os.mkdir(os.path.join(self.root_dir, "config", "3dwinds"))
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def check(self, root_dir):
+        swirl = Swirl.__new__(Swirl)
+        for name in _SUBDIRS:
+            setattr(swirl, f"{name}_path", os.path.join(root_dir, name))
+        swirl.config_3dwinds_path = os.path.join(swirl.config_path, "3dwinds")
+        swirl.check_paths_exist()
+
+    def test_relative_root(self):
+        os.chdir(self.root_dir)
+        self.check(".")
+        self.check("")
+
+    def test_unreadable_parent(self):
+        scandir = os.scandir
+
+        def fake_scandir(path):
+            if os.path.normpath(path) == os.path.normpath(self.root_dir):
+                raise PermissionError(13, "Permission denied", path)
+            return scandir(path)
+
+        with mock.patch("os.scandir", side_effect=fake_scandir):
+            self.check(self.root_dir)
+            os.rmdir(os.path.join(self.root_dir, "vols"))
+            with self.assertRaisesRegex(FileNotFoundError, "vols"):
+                self.check(self.root_dir)
+
+    def test_parent_is_a_file(self):
+        config_path = os.path.join(self.root_dir, "config")
+        os.rmdir(os.path.join(config_path, "3dwinds"))
+        os.rmdir(config_path)
+        open(config_path, "w").close()
+        with self.assertRaises(FileNotFoundError):
+            self.check(self.root_dir)
+
+
+
+class TestSwirlGet(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root_dir, self.etc_dir = make_tree(self.tmpdir.name)
+        Swirl._instances.clear()
+
+    def tearDown(self):
+        Swirl._instances.clear()
+        self.tmpdir.cleanup()
+
+    def test_cache_hit(self):
+        swirl = Swirl.get(self.root_dir, self.etc_dir)
+        self.assertIs(Swirl.get(self.root_dir, self.etc_dir), swirl)
+        self.assertIs(Swirl.get(self.root_dir + "/", self.etc_dir + "/"), swirl)
+
+    def test_invalidated_by_config_mtime(self):
+        fnames = [
+            os.path.join(self.etc_dir, "regions.json"),
+            os.path.join(self.etc_dir, "postmaster.conf"),
+            os.path.join(self.root_dir, "config", "radar_site_list.csv"),
+        ]
+        swirl = Swirl.get(self.root_dir, self.etc_dir)
+        for fname in fnames:
+            with self.subTest(fname):
+                mtime = os.stat(fname).st_mtime_ns + 10**9
+                os.utime(fname, ns=(mtime, mtime))
+                fresh = Swirl.get(self.root_dir, self.etc_dir)
+                self.assertIsNot(fresh, swirl)
+                self.assertIs(Swirl.get(self.root_dir, self.etc_dir), fresh)
+                swirl = fresh
+
+    def test_cache_hit_checks_paths(self):
+        Swirl.get(self.root_dir, self.etc_dir)
+        os.rmdir(os.path.join(self.root_dir, "vols"))
+        with self.assertRaises(FileNotFoundError):
+            Swirl.get(self.root_dir, self.etc_dir)
+        Swirl.get(self.root_dir, self.etc_dir, do_checks=False)
+
+
+
+class TestUpdateRidsInRegion(unittest.TestCase):
+    radar_dtime = datetime.datetime(2022, 12, 7, 1, 0)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        root_dir, etc_dir = make_tree(self.tmpdir.name, regions={"vic": [2, 3, 4, 5, 6, 7], "one": [2]})
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.swirl = Swirl(root_dir, etc_dir)
+        self.datestr = self.radar_dtime.strftime("%Y%m%d")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def day_path(self, rid):
+        return os.path.join(self.swirl.vols_path, str(rid), self.datestr)
+
+    def add_files(self, rid, *names):
+        path = self.day_path(rid)
+        os.makedirs(path, exist_ok=True)
+        for name in names:
+            open(os.path.join(path, name), "w").close()
+
+    def check(self, rid, max_radar_downtime=600):
+        return self.swirl._check_rid(rid, self.datestr, self.radar_dtime, max_radar_downtime)
+
+    def test_missing_day_directory(self):
+        self.assertEqual(self.check(2), "No data for radar 2 existing today. Removing radar 2 from region.")
+
+    def test_day_path_is_a_file(self):
+        os.makedirs(os.path.dirname(self.day_path(2)))
+        open(self.day_path(2), "w").close()
+        self.assertEqual(self.check(2), "No data for radar 2 existing today. Removing radar 2 from region.")
+
+    def test_empty_directory(self):
+        os.makedirs(self.day_path(2))
+        self.assertEqual(self.check(2), "No file found for radar 2. Removing radar 2 from region.")
+
+    def test_skip_hidden_and_dotless_names(self):
+        self.add_files(2, ".2_20221207_005500.h5", "2_20221207_005500")
+        self.assertEqual(self.check(2), "No file found for radar 2. Removing radar 2 from region.")
+        # The newer hidden/dot-less files must not hide that the real data is stale.
+        self.add_files(2, "2_20221207_000000.pvol.h5")
+        self.assertEqual(self.check(2), "No data for radar 2 for 1:00:00. Removing radar 2 from region.")
+
+    def test_stale_and_fresh(self):
+        self.add_files(2, "2_20221207_000000.pvol.h5", "2_20221207_005000.pvol.h5")
+        self.assertIsNone(self.check(2, max_radar_downtime=600))
+        self.assertEqual(
+            self.check(2, max_radar_downtime=599), "No data for radar 2 for 0:10:00. Removing radar 2 from region."
+        )
+
+    def test_region_order(self):
+        self.add_files(7, "7_20221207_005500.pvol.h5")
+        self.add_files(3, "3_20221207_005500.pvol.h5")
+        self.add_files(5, "5_20221206_005500.pvol.h5")
+        os.makedirs(self.day_path(6))
+        self.add_files(4, "4_20221207_005900.pvol.h5")
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            valid_rids = self.swirl.update_rids_in_region("vic", self.radar_dtime, 600)
+        self.assertEqual(valid_rids, [3, 4, 7])
+        self.assertEqual(
+            stdout.getvalue().splitlines(),
+            [
+                "No data for radar 2 existing today. Removing radar 2 from region.",
+                "No data for radar 5 for 1 day, 0:05:00. Removing radar 5 from region.",
+                "No file found for radar 6. Removing radar 6 from region.",
+            ],
+        )
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires os.fork")
+    def test_after_fork(self):
+        self.add_files(2, "2_20221207_005500.pvol.h5")
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Leave idle worker threads behind if the pool were to outlive the call.
+            for _ in range(3):
+                self.swirl.update_rids_in_region("vic", self.radar_dtime, 600)
+            pid = os.fork()
+            if pid == 0:
+                signal.alarm(10)
+                try:
+                    valid_rids = self.swirl.update_rids_in_region("one", self.radar_dtime, 600)
+                    os._exit(0 if valid_rids == [2] else 1)
+                except BaseException:
+                    os._exit(2)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+    def test_no_valid_radar(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(ValueError):
+                self.swirl.update_rids_in_region("vic", self.radar_dtime, 600)
+
+
+if __name__ == "__main__":
+    unittest.main()